@@ -2,23 +2,73 @@
 
 import streamlit as st
 import pandas as pd
-import tempfile
 import os
+import io
+import atexit
+import shutil
+import tempfile
 import logging
 import re
-from typing import List, Optional, IO
+import time
+import functools
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, IO, Set
 
 # Import project modules
-from extractor.pdf_reader import read_pdf
+from extractor.pdf_reader import read_pdf, has_text_layer, is_usable_text, TEXT_VERSION
 from extractor.ocr import ocr_pdf
-from extractor.llm_client import extract_summary_data
-from extractor.parser import process_transactions
+from extractor.llm_client import extract_summary_data_batch, extract_summary_data_bulk, LLM_BASE_URL, LLM_BATCH_SIZE, LLM_MODEL, PROMPT_VERSION
+from extractor import llm_cache, pdf_cache
+from extractor.summary_regex import extract_summary_data_regex
+from extractor.parser import load_transactions, enrich_transactions
 from extractor.excel_writer import create_final_report
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def find_matching_transaction_file(pdf_filename: str, transaction_files: List[IO[bytes]]) -> Optional[IO[bytes]]:
+# Upper bound on processing-log lines kept per session; older lines are dropped first.
+MAX_LOG_LINES = 5000
+
+# Minimum time between progress bar updates; each update is a round-trip to the browser.
+PROGRESS_INTERVAL = 0.5
+
+# Every token a transaction file name can be matched on: 'PFS...' numbers and bare digit runs.
+# Case, spaces, '_' and '-' between 'PFS' and its digits or inside the parentheses are tolerated.
+_KEY_RE = re.compile(r'PFS[\s_-]*\d+|\d+', re.IGNORECASE)
+_PAREN_RE = re.compile(r'\(\s*(\d+)\s*\)')
+_PFS_RE = re.compile(r'(PFS[\s_-]*\d+)', re.IGNORECASE)
+_SEPARATOR_RE = re.compile(r'[\s_-]+')
+_SPACES_RE = re.compile(r'[ \t]+')
+_NEWLINES_RE = re.compile(r' ?\n\s*')
+
+def _normalize_key(key: str) -> str:
+    """Canonical form of a matching key, e.g. 'pfs_2025000001235' -> 'PFS2025000001235'."""
+    return _SEPARATOR_RE.sub('', key).upper()
+
+def _is_invoice_details(file_name: str) -> bool:
+    """True for names like 'Invoice Details', 'INVOICE_DETAILS' or 'invoice-details'."""
+    return "INVOICE DETAILS" in _SEPARATOR_RE.sub(' ', file_name.upper())
+
+def build_transaction_index(transaction_files: List[IO[bytes]]) -> Dict[str, IO[bytes]]:
+    """
+    Scans the transaction file names once and maps every key they contain to the best file.
+    When several files share a key, the first one with "INVOICE DETAILS" in its name wins,
+    otherwise the first uploaded one.
+    """
+    index: Dict[str, IO[bytes]] = {}
+    has_invoice_details: Set[int] = {id(f) for f in transaction_files if f.name and _is_invoice_details(f.name)}
+    for file in transaction_files:
+        if not file.name:
+            continue
+        for key in map(_normalize_key, _KEY_RE.findall(file.name.strip())):
+            current = index.get(key)
+            if current is None or (id(file) in has_invoice_details and id(current) not in has_invoice_details):
+                index[key] = file
+    return index
+
+def find_matching_transaction_file(pdf_filename: str, transaction_index: Dict[str, IO[bytes]]) -> Optional[IO[bytes]]:
     """
     Finds the best corresponding transaction file for a given PDF.
     It first tries to match using a number in parentheses (e.g., '(153351)').
@@ -26,46 +76,236 @@ def find_matching_transaction_file(pdf_filename: str, transaction_files: List[IO
     """
     clean_pdf_filename = pdf_filename.strip()
     
-    primary_match = re.search(r'\((\d+)\)', clean_pdf_filename)
+    primary_match = _PAREN_RE.search(clean_pdf_filename)
     if primary_match:
         search_key = primary_match.group(1)
     else:
-        fallback_match = re.search(r'(PFS\d+)', clean_pdf_filename)
+        fallback_match = _PFS_RE.search(clean_pdf_filename)
         if not fallback_match:
             return None
         search_key = fallback_match.group(1)
         
-    candidates = [file for file in transaction_files if file.name and search_key in file.name.strip()]
-            
-    if not candidates:
-        return None
-        
-    for candidate in candidates:
-        if "INVOICE DETAILS" in candidate.name.upper():
-            return candidate
-            
-    return candidates[0]
+    return transaction_index.get(_normalize_key(search_key))
 
 # --- NEW SANITIZATION FUNCTION ---
+# Turkish letters mapped to their ASCII equivalents; str.translate applies the whole table in one C-level pass.
+_TURKISH_TO_ASCII = str.maketrans({
+    'İ': 'I', 'ı': 'i',
+    'Ş': 'S', 'ş': 's',
+    'Ğ': 'G', 'ğ': 'g',
+    'Ü': 'U', 'ü': 'u',
+    'Ö': 'O', 'ö': 'o',
+    'Ç': 'C', 'ç': 'c'
+})
+
+@functools.lru_cache(maxsize=64)
 def sanitize_text_for_api(text: str) -> str:
     """
     Manually replaces common non-ASCII Turkish characters with their ASCII equivalents
     to prevent encoding errors when sending text to an API.
+    Results are memoized, since the same (cached) PDF text is re-sanitized on every run.
+    Runs of spaces and blank lines are squeezed as well, so the LLM's character budget
+    is spent on invoice content rather than layout padding.
     """
-    replacements = {
-        'İ': 'I', 'ı': 'i',
-        'Ş': 'S', 'ş': 's',
-        'Ğ': 'G', 'ğ': 'g',
-        'Ü': 'U', 'ü': 'u',
-        'Ö': 'O', 'ö': 'o',
-        'Ç': 'C', 'ç': 'c'
-    }
-    for non_ascii, ascii_char in replacements.items():
-        text = text.replace(non_ascii, ascii_char)
+    text = text.translate(_TURKISH_TO_ASCII)
     # As a final fallback, encode and decode, ignoring any remaining errors
-    return text.encode('ascii', 'ignore').decode('ascii')
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    return _NEWLINES_RE.sub('\n', _SPACES_RE.sub(' ', text))
 # --- END NEW FUNCTION ---
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_transactions_cached(file_bytes: bytes, file_name: str) -> pd.DataFrame:
+    """
+    Parses a transaction file once and memoizes the cleaned frame by content,
+    so re-clicking "Process Files" or matching several invoices to one file does not re-read it.
+    """
+    transaction_file = io.BytesIO(file_bytes)
+    transaction_file.name = file_name
+    return load_transactions(transaction_file)
+
+@dataclass(slots=True)
+class InvoiceJob:
+    """Per-invoice state carried through the text, AI and report phases of a run."""
+    pdf_name: str
+    pdf_bytes: bytes
+    tran_file_name: str
+    transactions: pd.DataFrame
+    log: List[str] = field(default_factory=list)
+    text: Optional[str] = None
+    summary_data: Optional[dict] = None
+    output_filename: Optional[str] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+
+def _fail(job: InvoiceJob, e: Exception) -> None:
+    """Records an error on a job in the same format as the processing log."""
+    logger.error(f"Failed to process {job.pdf_name}: {e}", exc_info=True)
+    job.log.append(f"❌ ERROR: {e}")
+    job.error = str(e)
+
+def _read_invoice_text(job: InvoiceJob, use_cache: bool) -> None:
+    """
+    Phase 1 (worker thread): gets the PDF text from the cache, the text layer or OCR,
+    and looks up a cached AI summary for it or reads the summary fields directly from the text.
+    """
+    try:
+        pdf_key = pdf_cache.make_key(job.pdf_bytes, TEXT_VERSION)
+        text = pdf_cache.get(pdf_key)
+        if text:
+            job.log.append("Using cached PDF text...")
+        else:
+            # The rejected text layer is only a stand-in when OCR fails; it is not cached,
+            # so the PDF is OCR'd again on the next run.
+            use_text_layer_as_is = False
+            if has_text_layer(job.pdf_bytes):
+                job.log.append("Reading PDF...")
+                text = read_pdf(io.BytesIO(job.pdf_bytes))
+                if not is_usable_text(text):
+                    job.log.append("Text layer is too short or unreadable, running OCR...")
+                    try:
+                        ocr_text = ocr_pdf(io.BytesIO(job.pdf_bytes))
+                    except RuntimeError as e:
+                        if not text.strip(): raise
+                        job.log.append(f"⚠️ OCR failed ({e}), using the text layer as is.")
+                        ocr_text = ""
+                    use_text_layer_as_is = not ocr_text
+                    text = ocr_text or text
+            else:
+                job.log.append("No text layer found, running OCR...")
+                text = ocr_pdf(io.BytesIO(job.pdf_bytes))
+            if not text: raise ValueError("Could not extract text from PDF.")
+            if not use_text_layer_as_is:
+                pdf_cache.set(pdf_key, text)
+        job.text = text
+
+        if use_cache:
+            cleaned_text = sanitize_text_for_api(text)
+            job.summary_data = llm_cache.get(llm_cache.make_key(cleaned_text, PROMPT_VERSION, LLM_MODEL))
+            if job.summary_data is not None:
+                job.log.append("Using cached AI summary...")
+            else:
+                # Most invoices print all three fields in a fixed form; the LLM is only needed for the rest
+                job.summary_data = extract_summary_data_regex(cleaned_text)
+                if job.summary_data is not None:
+                    job.log.append("Found summary fields in the text, skipping AI...")
+    except Exception as e:
+        _fail(job, e)
+
+def _summarize_batch(jobs: List[InvoiceJob], api_key: str, use_batch_api: bool = False) -> None:
+    """
+    Phase 2 (worker thread): extracts the AI summaries for a batch of invoices, with one LLM call
+    or, when `use_batch_api` is set, as a single OpenAI Batch API job.
+    """
+    # Use the new sanitization function
+    cleaned_texts_for_ai = [sanitize_text_for_api(job.text) for job in jobs]
+    for job in jobs:
+        job.log.append(f"Extracting summary with AI ({'Batch API job' if use_batch_api else 'batch'} of {len(jobs)})...")
+    try:
+        summarize = extract_summary_data_bulk if use_batch_api else extract_summary_data_batch
+        results = summarize(cleaned_texts_for_ai, api_key)
+    except Exception as e:
+        for job in jobs:
+            _fail(job, e)
+        return
+    for job, cleaned_text, summary_data in zip(jobs, cleaned_texts_for_ai, results):
+        job.summary_data = summary_data
+        llm_cache.set(llm_cache.make_key(cleaned_text, PROMPT_VERSION, LLM_MODEL), summary_data)
+
+def _build_report(job: InvoiceJob, output_dir: str) -> None:
+    """
+    Phase 3 (worker thread): enriches the matched transactions and renders the Excel report
+    straight to `output_dir`, so the report bytes are not kept in memory.
+    """
+    try:
+        summary_data = job.summary_data
+        job.log.append(f" extracted: Date={summary_data.get('invoice_date')}, VAT={summary_data.get('vat_percentage')}%")
+
+        job.log.append("Processing transaction details...")
+        final_df = enrich_transactions(job.transactions, summary_data, job.text) # Use original text for business logic
+
+        job.output_filename = f"Final_Report_{os.path.splitext(job.pdf_name)[0]}.xlsx"
+        output_path = os.path.join(output_dir, job.output_filename)
+        with open(output_path, 'wb') as f:
+            f.write(create_final_report(final_df))
+        job.output_path = output_path
+        job.log.append(f"✅ Successfully generated report: {job.output_filename}")
+    except Exception as e:
+        _fail(job, e)
+
+def process_invoices(jobs: List[InvoiceJob], api_key: str, output_dir: str, use_cache: bool = True, on_progress: Optional[Callable[[int], None]] = None,
+                     use_batch_api: bool = False) -> None:
+    """
+    Runs all invoices through the pipeline on a shared thread pool, filling in each job.
+    The phases are pipelined rather than separated by barriers: an LLM batch is sent as soon as
+    LLM_BATCH_SIZE texts are ready (the last partial batch once all texts are in), and a report
+    is built as soon as its summary is known, so OCR, LLM round-trips and Excel writing overlap.
+    With `use_batch_api`, every uncached invoice goes into one Batch API job instead.
+    Never touches Streamlit; `on_progress` receives the number of finished jobs.
+    """
+    if not jobs:
+        return
+    finished = 0
+    batch_size = len(jobs) if use_batch_api else LLM_BATCH_SIZE
+    awaiting_summary: List[InvoiceJob] = []
+    with ThreadPoolExecutor(max_workers=min(8, len(jobs))) as executor:
+        futures = {executor.submit(_read_invoice_text, job, use_cache): ('text', [job]) for job in jobs}
+
+        def settle(job: InvoiceJob) -> None:
+            nonlocal finished
+            if job.error is None and job.summary_data is not None:
+                futures[executor.submit(_build_report, job, output_dir)] = ('report', [job])
+            else:
+                finished += 1
+                if on_progress: on_progress(finished)
+
+        def send_batch() -> None:
+            futures[executor.submit(_summarize_batch, list(awaiting_summary), api_key, use_batch_api)] = ('summary', list(awaiting_summary))
+            awaiting_summary.clear()
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, stage_jobs = futures.pop(future)
+                future.result()
+                if stage == 'text':
+                    job = stage_jobs[0]
+                    if job.error is None and job.summary_data is None:
+                        awaiting_summary.append(job)
+                        if len(awaiting_summary) >= batch_size: send_batch()
+                    else:
+                        settle(job)
+                elif stage == 'summary':
+                    for job in stage_jobs: settle(job)
+                else:
+                    finished += 1
+                    if on_progress: on_progress(finished)
+            if awaiting_summary and not any(stage == 'text' for stage, _ in futures.values()):
+                send_batch()
+
+def _throttled_progress(progress_bar, total: int) -> Callable[[int], None]:
+    """
+    Returns a function that moves the progress bar to `done / total`, sending at most one
+    update per PROGRESS_INTERVAL. The final update is always sent.
+    """
+    last_update = float('-inf')
+    def update(done: int) -> None:
+        nonlocal last_update
+        now = time.monotonic()
+        if done >= total or now - last_update >= PROGRESS_INTERVAL:
+            progress_bar.progress(done / total)
+            last_update = now
+    return update
+
+def _session_output_dir() -> str:
+    """
+    Returns the directory holding this session's generated reports, creating it on first use.
+    The directory is removed when the server process exits.
+    """
+    if 'output_dir' not in st.session_state:
+        st.session_state.output_dir = tempfile.mkdtemp(prefix="invoice_reports_")
+        atexit.register(shutil.rmtree, st.session_state.output_dir, ignore_errors=True)
+    return st.session_state.output_dir
+
 def main():
     """Defines the Streamlit UI and orchestrates the app flow."""
     st.set_page_config(page_title="Invoice Processor", layout="wide")
@@ -73,11 +313,19 @@ def main():
     st.markdown("Upload invoice PDFs and their corresponding transaction files. The tool will combine them into a final report.")
 
     if 'output_files' not in st.session_state: st.session_state.output_files = {}
-    if 'processing_log' not in st.session_state: st.session_state.processing_log = []
+    if 'processing_log' not in st.session_state: st.session_state.processing_log = deque(maxlen=MAX_LOG_LINES)
+    if 'processing_log_text' not in st.session_state: st.session_state.processing_log_text = ""
 
     with st.sidebar:
         st.header("Configuration")
-        api_key_input = st.text_input("Enter your OpenAI API Key", type="password")
+        if LLM_BASE_URL:
+            st.caption(f"Using local model `{LLM_MODEL}` at {LLM_BASE_URL}.")
+            api_key_input = ""
+        else:
+            api_key_input = st.text_input("Enter your OpenAI API Key", type="password")
+        force_fresh_llm = st.checkbox("Force fresh LLM call", help="Ignore cached AI results and always ask the AI, even when the fields can be read directly from the text.")
+        use_batch_api = st.checkbox("Use OpenAI Batch API", disabled=bool(LLM_BASE_URL),
+                                    help="Half the cost for large runs, but results can take minutes or longer to arrive.")
         st.header("Instructions")
         st.markdown("""
         1.  Enter API Key.
@@ -90,66 +338,82 @@ def main():
     transaction_files = st.file_uploader("2. Upload Transaction Files (CSV, XLS, XLSX)", type=['csv', 'xls', 'xlsx'], accept_multiple_files=True)
 
     if st.button("Process Files", type="primary"):
-        if not api_key_input: st.error("🚨 Please enter your OpenAI API key.")
+        if not api_key_input and not LLM_BASE_URL: st.error("🚨 Please enter your OpenAI API key.")
         elif not invoice_pdfs or not transaction_files: st.warning("⚠️ Please upload at least one PDF and one transaction file.")
         else:
-            st.session_state.output_files, st.session_state.processing_log = {}, []
-            progress_bar = st.progress(0)
+            # Reports from the previous run are replaced, not accumulated
+            for old_path in st.session_state.output_files.values():
+                if os.path.exists(old_path): os.unlink(old_path)
+            st.session_state.output_files, st.session_state.processing_log = {}, deque(maxlen=MAX_LOG_LINES)
+            log = st.session_state.processing_log
+            update_progress = _throttled_progress(st.progress(0), len(invoice_pdfs))
+            done = 0
 
-            for i, pdf_file in enumerate(invoice_pdfs):
-                log = st.session_state.processing_log
+            # Matching and reading uploads happen on the main thread; workers only get plain bytes and DataFrames.
+            transaction_index = build_transaction_index(transaction_files)
+            tasks = []
+            for pdf_file in invoice_pdfs:
                 pdf_name = pdf_file.name.strip()
-                log.append(f"--- Processing: {pdf_name} ---")
+                matching_tran_file = find_matching_transaction_file(pdf_name, transaction_index)
 
-                matching_tran_file = find_matching_transaction_file(pdf_name, transaction_files)
-                
                 if not matching_tran_file:
+                    log.append(f"--- Processing: {pdf_name} ---")
                     log.append(f"⚠️ WARNING: No matching transaction file found for {pdf_name}. Skipping.")
+                    done += 1
+                    update_progress(done)
+                    continue
+
+                # UploadedFile is a BytesIO; getvalue() on an unmodified BytesIO hands back its
+                # underlying bytes without copying, and BytesIO(pdf_bytes) in the worker shares them too.
+                tasks.append((pdf_file.getvalue(), pdf_name, matching_tran_file))
+
+            # Each transaction file is parsed once per click, however many invoices it is matched to.
+            transaction_frames = {}
+            for _, _, tran_file in tasks:
+                if id(tran_file) not in transaction_frames:
+                    try:
+                        transaction_frames[id(tran_file)] = _load_transactions_cached(tran_file.getvalue(), tran_file.name.strip())
+                    except Exception as e:
+                        logger.error(f"Failed to read {tran_file.name.strip()}: {e}", exc_info=True)
+                        transaction_frames[id(tran_file)] = e
+
+            jobs = []
+            for pdf_bytes, pdf_name, tran_file in tasks:
+                transactions = transaction_frames[id(tran_file)]
+                if isinstance(transactions, Exception):
+                    log.append(f"--- Processing: {pdf_name} ---")
+                    log.append(f"❌ ERROR: {transactions}")
+                    done += 1
+                    update_progress(done)
                     continue
-                
-                log.append(f"✅ Matched with: {matching_tran_file.name.strip()}")
-
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                        tmp.write(pdf_file.getvalue())
-                        pdf_path = tmp.name
-
-                    log.append("Reading PDF...")
-                    text = read_pdf(pdf_path) or ocr_pdf(pdf_path)
-                    if not text: raise ValueError("Could not extract text from PDF.")
-
-                    # Use the new sanitization function
-                    cleaned_text_for_ai = sanitize_text_for_api(text)
-                    
-                    log.append("Extracting summary with AI...")
-                    summary_data = extract_summary_data(cleaned_text_for_ai, api_key_input)
-                    log.append(f" extracted: Date={summary_data.get('invoice_date')}, VAT={summary_data.get('vat_percentage')}%")
-
-                    log.append("Processing transaction details...")
-                    final_df = process_transactions(matching_tran_file, summary_data, text) # Use original text for business logic
-                    
-                    output_filename = f"Final_Report_{os.path.splitext(pdf_name)[0]}.xlsx"
-                    excel_bytes = create_final_report(final_df)
-                    st.session_state.output_files[output_filename] = excel_bytes
-                    log.append(f"✅ Successfully generated report: {output_filename}")
-
-                except Exception as e:
-                    logger.error(f"Failed to process {pdf_name}: {e}", exc_info=True)
-                    log.append(f"❌ ERROR: {e}")
-                finally:
-                    if 'pdf_path' in locals() and os.path.exists(pdf_path): os.unlink(pdf_path)
-                    progress_bar.progress((i + 1) / len(invoice_pdfs))
+                jobs.append(InvoiceJob(pdf_name, pdf_bytes, tran_file.name.strip(), transactions))
+
+            skipped = done
+            process_invoices(jobs, api_key_input, _session_output_dir(), not force_fresh_llm,
+                             on_progress=lambda finished: update_progress(skipped + finished), use_batch_api=use_batch_api)
+
+            for job in jobs:
+                log.append(f"--- Processing: {job.pdf_name} ---")
+                log.append(f"✅ Matched with: {job.tran_file_name}")
+                log.extend(job.log)
+                if job.output_path is not None:
+                    st.session_state.output_files[job.output_filename] = job.output_path
+
+            # Joined once per run; later reruns (e.g. download clicks) reuse the string
+            st.session_state.processing_log_text = "\n".join(log)
 
     if st.session_state.output_files:
         st.header("✅ Processing Complete")
-        for filename, file_bytes in st.session_state.output_files.items():
-            st.download_button(
-                label=f"Download {filename}", data=file_bytes, file_name=filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+        for filename, file_path in st.session_state.output_files.items():
+            if not os.path.exists(file_path): continue
+            with open(file_path, 'rb') as f:
+                st.download_button(
+                    label=f"Download {filename}", data=f, file_name=filename,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
     
-    if st.session_state.processing_log:
-        with st.expander("Show Processing Log"): st.code("\n".join(st.session_state.processing_log))
+    if st.session_state.processing_log_text:
+        with st.expander("Show Processing Log"): st.code(st.session_state.processing_log_text)
 
 if __name__ == "__main__":
     main()
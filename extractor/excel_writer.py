@@ -2,32 +2,47 @@
 
 import pandas as pd
 import io
+import xlsxwriter
+
+# Cell format specs (Format objects belong to a workbook, so they are still created per report)
+HEADER_FORMAT = {'bold': True, 'valign': 'top', 'fg_color': '#D7E4BC', 'border': 1}
+CURRENCY_FORMAT = {'num_format': '#,##0.00', 'border': 1}
+
+# (column range, width, currency formatted) for the final report columns
+COLUMN_LAYOUT = (
+    ('A:A', 15, False),  # PLAKA
+    ('B:B', 40, False),  # RENTAL VEHICLE BRAND AND MODEL
+    ('C:D', 18, True),   # toplam ft.tutari, GROSS
+    ('E:G', 25, False),  # DATE, DESCTRIPTION, INVOICE
+)
 
 def create_final_report(df: pd.DataFrame) -> bytes:
     """
     Writes the final processed DataFrame to a formatted Excel file in memory.
+    Rows are streamed with xlsxwriter's constant_memory mode, so each row is
+    flushed as soon as the next one starts instead of keeping every cell alive.
+    URL detection is switched off: no column holds links, and it saves a regex match per string cell.
     """
     output_buffer = io.BytesIO()
-    with pd.ExcelWriter(output_buffer, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Transactions')
-        
-        workbook  = writer.book
-        worksheet = writer.sheets['Transactions']
-
-        # Define formats
-        header_format = workbook.add_format({
-            'bold': True, 'valign': 'top', 'fg_color': '#D7E4BC', 'border': 1
-        })
-        currency_format = workbook.add_format({'num_format': '#,##0.00', 'border': 1})
-        
-        # Write headers
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            
-        # Set column widths and formats
-        worksheet.set_column('A:A', 15)  # PLAKA
-        worksheet.set_column('B:B', 40)  # RENTAL VEHICLE BRAND AND MODEL
-        worksheet.set_column('C:D', 18, currency_format) # toplam ft.tutari, GROSS
-        worksheet.set_column('E:G', 25) # DATE, DESCTRIPTION, INVOICE
+    workbook = xlsxwriter.Workbook(output_buffer, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet('Transactions')
+
+    header_format = workbook.add_format(HEADER_FORMAT)
+    currency_format = workbook.add_format(CURRENCY_FORMAT)
+
+    # Set column widths and formats (must happen before any row is written in constant_memory mode)
+    for columns, width, is_currency in COLUMN_LAYOUT:
+        worksheet.set_column(columns, width, currency_format if is_currency else None)
+
+    # Write headers
+    worksheet.write_row(0, 0, df.columns, header_format)
+
+    # Write rows strictly in order; missing values become empty cells, as with to_excel.
+    # Each column is converted to a numpy object array once and the rows are zipped from those,
+    # which avoids building a namedtuple per row.
+    columns = [df[col].astype(object).where(df[col].notna(), None).to_numpy() for col in df.columns]
+    for row_num, row in enumerate(zip(*columns), start=1):
+        worksheet.write_row(row_num, 0, row)
 
+    workbook.close()
     return output_buffer.getvalue()
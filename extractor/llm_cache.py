@@ -0,0 +1,48 @@
+# extractor/llm_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "invoice_llm_cache")
+
+def make_key(text: str, prompt_version: str, model: str) -> str:
+    """
+    Builds a content-addressed cache key from the invoice text, the prompt version and the model,
+    so switching either the prompt or the model never serves answers produced by the other.
+    """
+    return hashlib.sha256(text.encode("utf-8") + b"\0" + prompt_version.encode("utf-8") + b"\0" + model.encode("utf-8")).hexdigest()
+
+def get(key: str) -> Optional[dict]:
+    """
+    Returns the cached LLM response for the given key, or None on a miss.
+    A corrupt or unreadable entry is treated as a miss.
+    """
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable LLM cache entry {path}: {e}")
+        return None
+
+def set(key: str, value: dict) -> None:
+    """
+    Stores an LLM response under the given key.
+    The file is written to a temporary name first and then renamed, so
+    concurrent readers never see a half-written entry.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=CACHE_DIR, suffix=".tmp", delete=False) as tmp:
+            json.dump(value, tmp)
+        os.replace(tmp.name, os.path.join(CACHE_DIR, f"{key}.json"))
+    except OSError as e:
+        logger.warning(f"Could not write LLM cache entry {key}: {e}")
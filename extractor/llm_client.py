@@ -3,40 +3,287 @@
 import openai
 import json
 import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Final, List, Optional
 
 logger = logging.getLogger(__name__)
 
-def extract_summary_data(text: str, api_key: str) -> dict:
+# Bump whenever the prompt below changes so cached responses are invalidated.
+PROMPT_VERSION = "summary-v4"
+
+# Model used for every summary request; part of the LLM cache key.
+# Pointing INVOICE_LLM_BASE_URL at a local OpenAI-compatible server (e.g. Ollama at
+# http://localhost:11434/v1) and INVOICE_LLM_MODEL at a quantized model such as
+# llama3.1:8b-instruct-q4_K_M runs extraction locally, without an API key or network round-trips.
+LLM_BASE_URL: Optional[str] = os.environ.get("INVOICE_LLM_BASE_URL") or None
+LLM_MODEL = os.environ.get("INVOICE_LLM_MODEL", "gpt-4o-mini")
+
+# Upper bound on invoices packed into one request; keeps the prompt well inside the context window.
+LLM_BATCH_SIZE = 5
+
+# Upper bound on requests in flight at once across all worker threads, to stay inside OpenAI rate limits.
+MAX_CONCURRENT_LLM_CALLS = 8
+
+# Static instructions sent as the system message of every request. It must stay byte-identical
+# across calls (no f-strings, dates or file names) and longer than 1024 tokens, so OpenAI's
+# automatic prompt caching can reuse the prefix; the invoice text goes only in the user message.
+SYSTEM_PROMPT: Final[str] = """You are a data extraction specialist for Turkish vehicle-leasing invoices issued by Partner Filo.
+The user message contains the text of one or more invoices, taken either from the PDF text layer or from OCR.
+The text has been folded to ASCII, so Turkish letters appear without their accents (for example "Sirket", "Odeme", "Irsaliye", "ISTISNA").
+OCR text may contain broken lines, column values glued together, headers and footers repeated on every page, stray characters and page numbers such as "Sayfa 1 / 2". Ignore all of those.
+
+Extract ONLY the following three fields for each invoice and return them as JSON.
+
+1. invoice_number
+   - Find the number like "PFS...". For example, "PFS2025000001235".
+   - It is usually labeled "Fatura No", "Fatura Numarasi" or "Belge No" and printed near the top of the first page.
+   - Return it exactly as printed, without spaces. OCR sometimes reads "PFS" as "PF5" or splits the digits with a space; return "PFS" followed by all of the digits.
+   - Do not confuse it with the ETTN (a UUID such as "3f2a6c1e-9b7d-4e51-a0c4-12ab34cd56ef"), the customer number, the tax number ("VKN", 10 digits), the Turkish ID number ("TCKN", 11 digits), or a contract or order number.
+
+2. invoice_date
+   - Find the date labeled "Tarih" or "Fatura Tarihi". It will be in DD.MM.YYYY format, occasionally DD/MM/YYYY or DD-MM-YYYY.
+   - Reformat it to YYYY-MM-DD. For example, "01.06.2025" becomes "2025-06-01".
+   - Use the invoice issue date. Do not use the payment due date ("Son Odeme Tarihi"), the dispatch note date ("Irsaliye Tarihi"), the print date, or the start or end of a rental period.
+   - If a time is printed next to the date (for example "01.06.2025 14:32"), drop the time.
+
+3. vat_percentage
+   - Find the VAT rate. Look for text like "HESAPLANAN KDV %20", "HESAPLANAN KDV(%20)", "KDV %10" or "KDV Orani: 20".
+   - Extract the number only (for example 20 or 10), without the "%" sign, as a JSON number rather than a string. It is very important to find this value.
+   - The current Turkish rates are 20, 10 and 1; invoices issued before July 2023 may show 18 or 8.
+   - Do not confuse the rate with the VAT amount ("HESAPLANAN KDV" followed by a TL amount such as "7.377,00"), with withholding ("TEVKIFAT") ratios such as "5/10", or with discount percentages.
+   - If the invoice is explicitly VAT exempt ("KDV ISTISNA", "%0"), return 0.
+
+If a field truly cannot be found, return null for it. Never guess, and never copy a value from one invoice to another when several invoices are given.
+
+Output format:
+- Respond with a single JSON object and nothing else: no prose, no Markdown, no code fences.
+- For a single invoice, return exactly these keys:
+  {"invoice_number": "PFS2025000001235", "invoice_date": "2025-06-01", "vat_percentage": 20}
+- When the message contains several invoices, each starting with a "--- INVOICE n ---" header, return one object per invoice, in the same order, wrapped in an "invoices" list:
+  {"invoices": [{"invoice_number": "PFS2025000001235", "invoice_date": "2025-06-01", "vat_percentage": 20}, {"invoice_number": "PFS2025000001236", "invoice_date": "2025-06-01", "vat_percentage": 10}]}
+  The "invoices" list must contain exactly one entry per invoice header, even when an entry has only null values.
+
+Example 1 (single invoice, text layer):
+  Input excerpt:
+    PARTNER FILO SIRKETI ... e-FATURA
+    Fatura No: PFS2025000001235
+    Fatura Tarihi: 01.06.2025 Son Odeme Tarihi: 15.06.2025
+    ETTN: 3f2a6c1e-9b7d-4e51-a0c4-12ab34cd56ef
+    MAL HIZMET TOPLAM TUTARI 36.885,00 TL
+    HESAPLANAN KDV(%20) 7.377,00 TL
+    VERGILER DAHIL TOPLAM TUTAR 44.262,00 TL
+  Output:
+    {"invoice_number": "PFS2025000001235", "invoice_date": "2025-06-01", "vat_percentage": 20}
+
+Example 2 (single invoice, noisy OCR):
+  Input excerpt:
+    Belge No : PF5 2025000004410
+    Tarih 30/04/2025
+    Sayfa 1 / 2
+    HESAPLANAN KDV %10 ...... 1.250,00
+  Output:
+    {"invoice_number": "PFS2025000004410", "invoice_date": "2025-04-30", "vat_percentage": 10}
+
+Example 3 (VAT rate missing):
+  Input excerpt:
+    Fatura No: PFS2025000000987 Tarih: 12.03.2025
+    ARA TOPLAM 12.000,00
+  Output:
+    {"invoice_number": "PFS2025000000987", "invoice_date": "2025-03-12", "vat_percentage": null}
+"""
+
+# Transient API errors (rate limits, timeouts, dropped connections) are retried with exponential
+# backoff; anything else, e.g. a bad API key or a rejected request, is raised immediately.
+LLM_MAX_ATTEMPTS = 3
+LLM_TIMEOUT = 60.0  # seconds per request; a summary normally returns in a few seconds
+LLM_RETRY_BASE_DELAY = 1.0
+LLM_RETRY_MAX_DELAY = 30.0
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)
+
+# Polling schedule for Batch API jobs: start fast, back off to once a minute.
+BATCH_POLL_INITIAL_DELAY = 5.0
+BATCH_POLL_MAX_DELAY = 60.0
+
+# Plain JSON mode for single invoices; batches use a strict schema so the reply is always
+# an "invoices" list of well-formed objects (the count is still checked after parsing).
+_JSON_OBJECT_FORMAT = {"type": "json_object"}
+_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "invoice_number": {"type": ["string", "null"]},
+        "invoice_date": {"type": ["string", "null"]},
+        "vat_percentage": {"type": ["number", "null"]},
+    },
+    "required": ["invoice_number", "invoice_date", "vat_percentage"],
+    "additionalProperties": False,
+}
+_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "invoice_summaries",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"invoices": {"type": "array", "items": _SUMMARY_SCHEMA}},
+            "required": ["invoices"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_clients: Dict[str, openai.OpenAI] = {}
+_clients_lock = threading.Lock()
+_llm_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LLM_CALLS)
+
+def _get_client(api_key: str) -> openai.OpenAI:
     """
-    Extracts only the high-level summary data (Invoice #, Date, VAT) from the invoice text.
+    Returns a shared OpenAI client for the given API key.
+    The client keeps its HTTP connection pool alive, so concurrent and repeated
+    calls reuse open TLS connections instead of handshaking per invoice.
     """
-    openai.api_key = api_key
-    
-    prompt = f"""
-    You are a data extraction specialist. From the provided OCR text of a Turkish invoice,
-    extract ONLY the following three fields and return them in a JSON object.
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # Local servers ignore the key, but the OpenAI client refuses to start without one
+            # Retries are handled in _complete, so the client's own retry loop is switched off; the
+            # timeout (default 10 minutes) is cut so a stalled request is retried instead of waited on
+            client = _clients[api_key] = openai.OpenAI(api_key=api_key or "local", base_url=LLM_BASE_URL,
+                                                       timeout=LLM_TIMEOUT, max_retries=0)
+        return client
 
-    1.  **invoice_number**: Find the number like "PFS...". For example, "PFS2025000001235".
-    2.  **invoice_date**: Find the date labeled "Tarih". It will be in DD.MM.YYYY format. Reformat it to YYYY-MM-DD.
-    3.  **vat_percentage**: Find the VAT rate. Look for text like **"HESAPLANAN KDV %20"** or **"KDV %10"**. Extract the number (20 or 10). It is very important to find this value.
+def _complete(user_content: str, api_key: str, response_format: dict = _JSON_OBJECT_FORMAT) -> str:
+    """
+    Sends one chat completion and returns the raw message content.
+    Callers run on a thread pool; the semaphore caps how many requests are in flight,
+    so the LLM phase takes roughly the slowest call instead of the sum of all calls
+    without tripping the rate limit on large uploads.
+    Transient errors are retried up to LLM_MAX_ATTEMPTS times; the backoff sleep happens
+    outside the semaphore, so a throttled call does not hold up the others.
+    """
+    for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+        try:
+            with _llm_slots:
+                response = _get_client(api_key).chat.completions.create(**_request_body(user_content, response_format))
+            break
+        except _RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_ATTEMPTS:
+                raise
+            delay = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(1.0, 1.5)
+            logger.warning(f"Transient LLM error ({e}); retrying in {delay:.1f}s (attempt {attempt} of {LLM_MAX_ATTEMPTS}).")
+            time.sleep(delay)
+    _log_prompt_cache_usage(response)
+    return response.choices[0].message.content
 
-    --- OCR TEXT ---
-    {text[:4000]}
-    --- END TEXT ---
+def _log_prompt_cache_usage(response) -> None:
+    """Logs how much of the prompt was served from OpenAI's prompt cache (the static SYSTEM_PROMPT prefix)."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        logger.info(f"LLM prompt tokens: {usage.prompt_tokens}, cached: {details.cached_tokens or 0}")
 
-    JSON Output:
-    """
+def _request_body(user_content: str, response_format: dict = _JSON_OBJECT_FORMAT) -> dict:
+    """Builds the chat completion parameters shared by direct calls and Batch API requests."""
+    return {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_content},
+        ],
+        "response_format": response_format,
+        "temperature": 0.0,
+    }
 
+def _single_invoice_content(text: str) -> str:
+    """Wraps one invoice's text as the user message."""
+    return f"--- OCR TEXT ---\n{text[:4000]}\n--- END TEXT ---"
+
+def extract_summary_data(text: str, api_key: str) -> dict:
+    """
+    Extracts only the high-level summary data (Invoice #, Date, VAT) from the invoice text.
+    """
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.0,
-        )
-        content = response.choices[0].message.content
+        content = _complete(_single_invoice_content(text), api_key)
         logger.info(f"LLM Summary Response: {content}")
         return json.loads(content)
     except Exception as e:
         logger.error(f"Error during LLM call for summary data: {e}")
         raise RuntimeError(f"Failed to extract summary data from PDF: {e}")
+
+def extract_summary_data_batch(texts: List[str], api_key: str) -> List[dict]:
+    """
+    Extracts the summary data for several invoices with a single LLM call, so the
+    instructions and the network round-trip are paid once per batch instead of once per invoice.
+    Results are returned in the same order as `texts`. If the batched answer cannot be
+    matched back to the inputs, each invoice is retried on its own.
+    """
+    if len(texts) == 1:
+        return [extract_summary_data(texts[0], api_key)]
+
+    sections = "".join(f"--- INVOICE {i} ---\n{text[:4000]}\n" for i, text in enumerate(texts, 1))
+    user_content = f"This message contains {len(texts)} invoices.\n{sections}--- END INVOICES ---"
+
+    try:
+        content = _complete(user_content, api_key, _BATCH_RESPONSE_FORMAT)
+        logger.info(f"LLM Batch Summary Response: {content}")
+    except Exception as e:
+        logger.error(f"Error during batched LLM call for summary data: {e}")
+        raise RuntimeError(f"Failed to extract summary data from PDFs: {e}")
+
+    try:
+        results = json.loads(content).get("invoices")
+        if not isinstance(results, list) or len(results) != len(texts) or not all(isinstance(r, dict) for r in results):
+            raise ValueError(f"expected {len(texts)} invoice objects")
+        return results
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"Could not map batched LLM response back to invoices ({e}); falling back to one call per invoice.")
+        return [extract_summary_data(text, api_key) for text in texts]
+
+def extract_summary_data_bulk(texts: List[str], api_key: str) -> List[dict]:
+    """
+    Extracts the summary data for many invoices through OpenAI's Batch API, which costs half
+    as much as direct calls but may take minutes to complete. One request per invoice is
+    uploaded as a JSONL file and the job is polled with exponential backoff. Results are
+    returned in the same order as `texts`; invoices whose request failed inside the batch
+    are retried with a direct call.
+    """
+    # The shared client leaves retries to _complete; file uploads and polling keep the library's own
+    client = _get_client(api_key).with_options(max_retries=2)
+    lines = [
+        json.dumps({"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions",
+                    "body": _request_body(_single_invoice_content(text))})
+        for i, text in enumerate(texts)
+    ]
+
+    try:
+        batch_file = client.files.create(file=("invoices.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        delay = BATCH_POLL_INITIAL_DELAY
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"batch {batch.id} ended with status '{batch.status}'")
+        output = client.files.content(batch.output_file_id).text
+    except Exception as e:
+        logger.error(f"Error during Batch API run for summary data: {e}")
+        raise RuntimeError(f"Failed to extract summary data from PDFs: {e}")
+
+    results: Dict[str, dict] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        try:
+            results[record["custom_id"]] = json.loads(response["body"]["choices"][0]["message"]["content"])
+        except (KeyError, IndexError, ValueError) as e:
+            logger.warning(f"Unreadable Batch API result for invoice {record.get('custom_id')}: {e}")
+    logger.info(f"Batch API returned {len(results)} of {len(texts)} summaries.")
+
+    return [results[str(i)] if str(i) in results else extract_summary_data(text, api_key) for i, text in enumerate(texts)]
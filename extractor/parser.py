@@ -1,82 +1,196 @@
 # extractor/parser.py (Final Version with Zero-Amount Filtering)
 
 import pandas as pd
+import functools
+import itertools
+import openpyxl
 import os
-from typing import Dict, IO, List, Optional
-from dateutil import parser as dateparser
+import re
+from datetime import datetime
+from typing import Dict, IO, List
+
+def _read_preview(file: IO[bytes], nrows: int) -> pd.DataFrame:
+    """
+    Reads the first `nrows` rows of the first sheet (or of a CSV) without a header.
+    .xlsx files are streamed with openpyxl's read-only mode, which stops after `nrows` rows;
+    calamine and pandas' own readers parse the whole sheet before applying nrows.
+    """
+    if file.name.endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            # Read-only mode trusts the sheet's stored dimension, which some exporters leave at "A1"
+            sheet.reset_dimensions()
+            rows = list(itertools.islice(sheet.iter_rows(values_only=True), nrows))
+        finally:
+            workbook.close()
+        return pd.DataFrame(rows)
+    # calamine (Rust) reads legacy .xls and is much faster than xlrd
+    return pd.read_excel(file, header=None, nrows=nrows, engine='calamine') if file.name.endswith('.xls') else pd.read_csv(file, header=None, nrows=nrows)
 
 def find_header_row(file: IO[bytes], keywords: List[str]) -> int:
     """Reads the first few lines of a file to find the correct header row number."""
-    # Use xlrd engine for .xls files, openpyxl for .xlsx
-    engine = 'xlrd' if file.name.endswith('.xls') else 'openpyxl'
-    df_preview = pd.read_excel(file, header=None, nrows=10, engine=engine) if file.name.endswith(('.xls', '.xlsx')) else pd.read_csv(file, header=None, nrows=10)
-    
-    for index, row in df_preview.iterrows():
-        row_str = ' '.join(str(x).upper() for x in row.dropna())
-        if any(key.upper() in row_str for key in keywords):
-            file.seek(0) # Reset file pointer after reading
-            return index
-            
-    file.seek(0) # Reset file pointer if nothing is found
-    raise ValueError("Could not find a valid header row containing keywords like 'PLATE' or 'PLAKA'.")
-
-def find_column(columns: List[str], keywords: List[str]) -> Optional[str]:
-    """Helper function to find a column name that contains any of the given keywords."""
+    df_preview = _read_preview(file, 10)
+    file.seek(0) # Reset file pointer after reading
+
+    # One vectorized search over every non-empty cell instead of joining each row in Python;
+    # stack() walks the preview row by row, so the first hit is the topmost matching row.
+    pattern = '|'.join(re.escape(key) for key in keywords)
+    cells = df_preview.stack().dropna()
+    hits = cells.astype(str).str.contains(pattern, case=False, regex=True)
+    if not hits.any():
+        raise ValueError("Could not find a valid header row containing keywords like 'PLATE' or 'PLAKA'.")
+    return int(hits.idxmax()[0])
+
+# Report column -> (name used in error messages, keywords to look for in the file's header)
+_TRANSACTION_COLUMNS = {
+    'PLAKA': ('Plate', ('PLATE', 'PLAKA')),
+    'RENTAL VEHICLE BRAND AND MODEL': ('Brand', ('BRAND', 'MODEL')),
+    'toplam ft.tutari': ('Amount', ('TOTAL RENT', 'TOTAL AMOUNT')),
+}
+
+def find_columns(columns: List[str]) -> Dict[str, str]:
+    """
+    Maps each report column to the first file column whose name contains one of its keywords,
+    in a single pass over the header. Report columns without a match are left out.
+    """
+    found = {}
     for col in columns:
-        if any(key.upper() in str(col).upper() for key in keywords):
-            return col
-    return None
+        name = str(col).upper()
+        for target, (_, keywords) in _TRANSACTION_COLUMNS.items():
+            if target not in found and any(key in name for key in keywords):
+                found[target] = col
+        if len(found) == len(_TRANSACTION_COLUMNS):
+            break
+    return found
 
-def process_transactions(transaction_file: IO[bytes], summary_data: Dict, pdf_text: str) -> pd.DataFrame:
+def _parse_amounts(values: pd.Series) -> pd.Series:
     """
-    Reads a transaction file, enriches it with summary data from a PDF,
-    and formats it into the final report structure.
+    Converts an amount column to floats. Columns read as text may use the Turkish format
+    ("3.450.961,18") or the English one ("1,234.56"); whichever of comma and dot comes last
+    is the decimal point and the other is a thousands separator. Commas that only group whole
+    thousands ("2,500", "1,000,000") are English thousands separators. Unparseable values become NaN.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    text = values.astype(str).str.strip()
+    english_thousands = text.str.fullmatch(r'-?\d{1,3}(?:,\d{3})+')
+    turkish = (text.str.rfind(',') > text.str.rfind('.')) & ~english_thousands
+    text = text.where(
+        ~turkish, text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    ).str.replace(',', '', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+def load_transactions(transaction_file: IO[bytes]) -> pd.DataFrame:
+    """
+    Reads and cleans a transaction file into the PLAKA / brand / amount columns.
+    The result does not depend on any invoice, so it can be shared by every
+    invoice matched to the same file.
     """
     header_row_index = find_header_row(transaction_file, ['PLATE', 'PLAKA'])
     
     file_extension = os.path.splitext(transaction_file.name)[1].lower()
-    engine = 'xlrd' if file_extension == '.xls' else 'openpyxl'
-    df = pd.read_csv(transaction_file, header=header_row_index) if file_extension == '.csv' else pd.read_excel(transaction_file, header=header_row_index, engine=engine)
-
-    plate_col = find_column(df.columns, ['PLATE', 'PLAKA'])
-    brand_col = find_column(df.columns, ['BRAND', 'MODEL'])
-    amount_col = find_column(df.columns, ['TOTAL RENT', 'TOTAL AMOUNT'])
+    is_csv = file_extension == '.csv'
+    if is_csv:
+        # Only the header row is parsed first, so the full read below can skip every column other
+        # than the three it needs (exports are often dozens of columns wide). This stays on the
+        # default engine because pyarrow does not support nrows.
+        header = pd.read_csv(transaction_file, header=header_row_index, nrows=0).columns
+        transaction_file.seek(0)
+    else:
+        # calamine parses the whole sheet even for nrows=0, so Excel files are read once in full
+        df = pd.read_excel(transaction_file, header=header_row_index, engine='calamine')
+        header = df.columns
 
-    if not all([plate_col, brand_col, amount_col]):
-        missing = [col for col, name in [('Plate', plate_col), ('Brand', brand_col), ('Amount', amount_col)] if not name]
+    source_columns = find_columns(header)
+    missing = [label for target, (label, _) in _TRANSACTION_COLUMNS.items() if target not in source_columns]
+    if missing:
         raise ValueError(f"Could not find required columns in {transaction_file.name}: {', '.join(missing)}")
 
-    df = df[[plate_col, brand_col, amount_col]].rename(columns={
-        plate_col: 'PLAKA',
-        brand_col: 'RENTAL VEHICLE BRAND AND MODEL',
-        amount_col: 'toplam ft.tutari'
-    })
+    usecols = list(dict.fromkeys(source_columns.values()))
+    if is_csv:
+        # pyarrow's multi-threaded CSV reader
+        df = pd.read_csv(transaction_file, header=header_row_index, usecols=usecols, engine='pyarrow')
+    else:
+        # Narrow the full-width sheet to the same columns the CSV read keeps
+        df = df[usecols]
+
+    # Select before renaming: other columns matching a keyword (e.g. both PLATE and PLAKA)
+    # would otherwise end up with the same report name
+    df = df[list(source_columns.values())].rename(
+        columns={col: target for target, col in source_columns.items()}
+    )[list(_TRANSACTION_COLUMNS)]
 
     # --- Data Cleaning Steps ---
+    # All conditions are combined into one boolean mask so the frame is filtered (and copied) once.
     # 1. Drop footer rows that don't have a plate number.
-    df.dropna(subset=['PLAKA'], inplace=True)
-    df = df[df['PLAKA'].astype(str).str.strip() != '']
+    plates = df['PLAKA']
+    has_plate = plates.notna() & (plates.astype(str).str.strip() != '')
     
     # 2. Convert amount column to a number, forcing errors to be empty.
-    df['toplam ft.tutari'] = pd.to_numeric(df['toplam ft.tutari'], errors='coerce').fillna(0)
+    amounts = _parse_amounts(df['toplam ft.tutari']).fillna(0)
     
-    # 3. **NEW**: Filter out any rows where the amount is zero.
-    df = df[df['toplam ft.tutari'] > 0].copy()
+    # 3. Filter out any rows where the amount is zero.
+    keep = has_plate & (amounts > 0)
+    df = df.loc[keep].copy()
+    df['toplam ft.tutari'] = amounts[keep]
     # --- End Cleaning ---
 
+    return df
+
+# Day-first date formats the LLM falls back to, each with a cheap shape check so that
+# strptime is only attempted with the format that can match.
+_DAY_FIRST_FORMATS = [
+    (re.compile(r'\d{1,2}\.\d{1,2}\.\d{4}'), '%d.%m.%Y'),
+    (re.compile(r'\d{1,2}-\d{1,2}-\d{4}'), '%d-%m-%Y'),
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4}'), '%d/%m/%Y'),
+]
+
+@functools.lru_cache(maxsize=1024)
+def _parse_invoice_date(date_str: str) -> datetime:
+    """
+    Parses the invoice date returned by the LLM. The prompt asks for YYYY-MM-DD, which
+    fromisoformat handles directly; the Turkish DD.MM.YYYY / DD-MM-YYYY forms are tried next,
+    and dateutil's much slower generic parser is only the last resort.
+    Results are memoized: invoices in a run usually share a handful of dates (month ends).
+    """
+    date_str = date_str.strip()
+    try:
+        return datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+    for shape, date_format in _DAY_FIRST_FORMATS:
+        if shape.fullmatch(date_str):
+            try:
+                return datetime.strptime(date_str, date_format)
+            except ValueError:
+                break  # right shape but not a real date (e.g. 31.02.2025)
+    # Imported here: dateutil's parser is slow to import and rarely needed
+    from dateutil import parser as dateparser
+    return dateparser.parse(date_str)
+
+def enrich_transactions(transactions: pd.DataFrame, summary_data: Dict, pdf_text: str) -> pd.DataFrame:
+    """
+    Enriches cleaned transactions with summary data from a PDF
+    and formats them into the final report structure.
+    The input frame is not modified.
+    """
     # --- Data Enrichment & Calculation ---
     vat_raw = summary_data.get('vat_percentage')
     vat_rate = (float(vat_raw) / 100.0) if vat_raw is not None else 0.20
 
     date_str = summary_data.get('invoice_date')
-    invoice_date = dateparser.parse(date_str).strftime('%d.%m.%Y') if date_str else None
+    invoice_date = _parse_invoice_date(date_str).strftime('%d.%m.%Y') if date_str else None
 
     description = "leasing" if "LINE 1" in pdf_text else "GEN.EXP"
 
-    df['GROSS'] = df['toplam ft.tutari'] * (1 + vat_rate)
-    df['DATE'] = invoice_date
-    df['DESCTRIPTION'] = description
-    df['INVOICE'] = summary_data.get('invoice_number')
+    # assign() adds all four columns in a single copy of the shared transactions frame
+    df = transactions.assign(
+        GROSS=transactions['toplam ft.tutari'] * (1 + vat_rate),
+        DATE=invoice_date,
+        DESCTRIPTION=description,
+        INVOICE=summary_data.get('invoice_number'),
+    )
 
     final_columns = [
         'PLAKA', 'RENTAL VEHICLE BRAND AND MODEL', 'toplam ft.tutari',
@@ -85,3 +199,10 @@ def process_transactions(transaction_file: IO[bytes], summary_data: Dict, pdf_te
     df = df[final_columns]
 
     return df
+
+def process_transactions(transaction_file: IO[bytes], summary_data: Dict, pdf_text: str) -> pd.DataFrame:
+    """
+    Reads a transaction file, enriches it with summary data from a PDF,
+    and formats it into the final report structure.
+    """
+    return enrich_transactions(load_transactions(transaction_file), summary_data, pdf_text)
@@ -0,0 +1,44 @@
+# extractor/pdf_cache.py
+
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "invoice_pdf_text")
+
+def make_key(pdf_bytes: bytes, text_version: str) -> str:
+    """
+    Fingerprints a PDF by its raw bytes and the text extraction version, so text produced
+    by an older reader or OCR setup is never served after extraction changes.
+    BLAKE2b is used instead of SHA-256 because it is considerably faster on
+    large scans and we only need collision resistance for caching.
+    """
+    digest = hashlib.blake2b(pdf_bytes, digest_size=16)
+    digest.update(b"\0" + text_version.encode("utf-8"))
+    return digest.hexdigest()
+
+def get(key: str) -> Optional[str]:
+    """Returns the cached text (PDF text layer or OCR output) for a PDF, or None on a miss."""
+    path = os.path.join(CACHE_DIR, f"{key}.txt")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Ignoring unreadable PDF text cache entry {path}: {e}")
+        return None
+
+def set(key: str, text: str) -> None:
+    """Stores the extracted text for a PDF, writing atomically via a temporary file and os.replace."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=CACHE_DIR, suffix=".tmp", delete=False) as tmp:
+            tmp.write(text)
+        os.replace(tmp.name, os.path.join(CACHE_DIR, f"{key}.txt"))
+    except OSError as e:
+        logger.warning(f"Could not write PDF text cache entry {key}: {e}")
@@ -0,0 +1,46 @@
+# extractor/summary_regex.py
+
+import re
+from datetime import datetime
+from typing import Optional
+
+# All three fields are found in a single pass over the text, one named group per field:
+# - inv:  "PFS" followed by the year and a running number, e.g. PFS2025000001235.
+# - date: "Tarih" / "Fatura Tarihi" followed by a DD.MM.YYYY date; payment-due and dispatch-note
+#         dates ("Son Odeme Tarihi", "Irsaliye Tarihi") are excluded.
+# - vat:  "KDV %20", "KDV(%20)", "HESAPLANAN KDV (%10)".
+_SUMMARY_FIELDS_RE = re.compile(
+    r'(?P<inv>\bPFS\d{10,}\b)'
+    r'|(?i:(?<!Odeme )(?<!Irsaliye )\bTarihi?\s*:?\s*(?P<day>\d{2})[./-](?P<month>\d{2})[./-](?P<year>\d{4}))'
+    r'|(?i:\bKDV\s*\(?\s*%\s*(?P<vat>\d{1,2})\b)'
+)
+
+def extract_summary_data_regex(text: str) -> Optional[dict]:
+    """
+    Extracts the invoice number, date and VAT rate with regular expressions, in the same shape
+    as the LLM answer. Returns None unless all three are found unambiguously (exactly one
+    distinct invoice number, date and VAT rate), in which case the LLM is needed.
+    Other dated lines ("Vade Tarihi", "Siparis Tarihi", ...) make the date ambiguous.
+    """
+    invoice_numbers, invoice_dates, vat_rates = set(), set(), set()
+    for match in _SUMMARY_FIELDS_RE.finditer(text):
+        if match['inv']:
+            invoice_numbers.add(match['inv'])
+        elif match['vat']:
+            vat_rates.add(int(match['vat']))
+        else:
+            invoice_dates.add((match['year'], match['month'], match['day']))
+    if len(invoice_numbers) != 1 or len(invoice_dates) != 1 or len(vat_rates) != 1:
+        return None
+
+    year, month, day = invoice_dates.pop()
+    try:
+        invoice_date = datetime(int(year), int(month), int(day)).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+    return {
+        "invoice_number": invoice_numbers.pop(),
+        "invoice_date": invoice_date,
+        "vat_percentage": vat_rates.pop(),
+    }
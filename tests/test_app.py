@@ -0,0 +1,49 @@
+import io
+import pytest
+from app import build_transaction_index, find_matching_transaction_file, sanitize_text_for_api
+
+def _named(name):
+    """Creates an empty in-memory upload with the given file name."""
+    file = io.BytesIO(b"")
+    file.name = name
+    return file
+
+@pytest.fixture
+def transaction_files():
+    """Provides a set of uploaded transaction files with overlapping keys."""
+    return [
+        _named("Summary (153351).xlsx"),
+        _named("Invoice Details (153351).xlsx"),
+        _named("PFS2025000001235 transactions.csv"),
+        _named("Other (999999).xls"),
+    ]
+
+def test_match_by_parenthesized_number_prefers_invoice_details(transaction_files):
+    """Tests that the '(number)' key is used and INVOICE DETAILS files win ties."""
+    index = build_transaction_index(transaction_files)
+    match = find_matching_transaction_file(" Invoice PFS2025000009999 (153351).pdf ", index)
+    assert match is transaction_files[1]
+
+def test_match_falls_back_to_pfs_number(transaction_files):
+    """Tests the fallback to the 'PFS...' invoice number."""
+    index = build_transaction_index(transaction_files)
+    match = find_matching_transaction_file("PFS2025000001235.pdf", index)
+    assert match is transaction_files[2]
+
+def test_no_match(transaction_files):
+    """Tests that unknown or key-less PDF names return None."""
+    index = build_transaction_index(transaction_files)
+    assert find_matching_transaction_file("Invoice (123).pdf", index) is None
+    assert find_matching_transaction_file("scan.pdf", index) is None
+
+def test_match_tolerates_filename_variations():
+    """Tests that case, spaces and separators in file names do not prevent a match."""
+    files = [_named("invoice_details ( 153351 ).xlsx"), _named("pfs_2025000001235 export.csv")]
+    index = build_transaction_index(files)
+
+    assert find_matching_transaction_file("Invoice ( 153351 ).pdf", index) is files[0]
+    assert find_matching_transaction_file("Fatura PFS 2025000001235.pdf", index) is files[1]
+
+def test_sanitize_text_for_api():
+    """Tests that Turkish letters are folded to ASCII and other non-ASCII characters are dropped."""
+    assert sanitize_text_for_api("İŞĞÜÖÇ ışğüöç KDV %20 €") == "ISGUOC isguoc KDV %20 "
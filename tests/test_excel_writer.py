@@ -0,0 +1,28 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from extractor.excel_writer import create_final_report
+
+@pytest.fixture
+def final_df():
+    """Provides a processed transactions frame like the one produced by the parser."""
+    return pd.DataFrame({
+        'PLAKA': ['34-KVN-771', '34-DEF-456'],
+        'RENTAL VEHICLE BRAND AND MODEL': ['MERCEDES-BENZ A 200 SEDAN', np.nan],
+        'toplam ft.tutari': [36885.00, 1000.0],
+        'GROSS': [44262.00, 1200.0],
+        'DATE': ['01.06.2025', '01.06.2025'],
+        'DESCTRIPTION': ['leasing', 'leasing'],
+        'INVOICE': ['PFS2025000001235', 'PFS2025000001235'],
+    })
+
+def test_create_final_report_round_trip(final_df):
+    """Tests that the report contains the headers and values of the frame, with blanks for missing values."""
+    report = pd.read_excel(io.BytesIO(create_final_report(final_df)), sheet_name='Transactions')
+
+    assert list(report.columns) == list(final_df.columns)
+    assert list(report['PLAKA']) == ['34-KVN-771', '34-DEF-456']
+    assert list(report['GROSS']) == pytest.approx([44262.00, 1200.0])
+    assert pd.isna(report['RENTAL VEHICLE BRAND AND MODEL'].iloc[1])
+    assert list(report['INVOICE']) == ['PFS2025000001235', 'PFS2025000001235']
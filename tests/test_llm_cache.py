@@ -0,0 +1,23 @@
+import pytest
+from extractor import llm_cache
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Points the LLM cache at a throwaway directory."""
+    monkeypatch.setattr(llm_cache, "CACHE_DIR", str(tmp_path / "llm_cache"))
+
+def test_cache_round_trip():
+    """Tests that a stored response is returned for the same key."""
+    key = llm_cache.make_key("invoice text", "v1", "gpt-4o")
+    assert llm_cache.get(key) is None
+
+    llm_cache.set(key, {"invoice_number": "PFS2025000001235", "vat_percentage": 20})
+    assert llm_cache.get(key) == {"invoice_number": "PFS2025000001235", "vat_percentage": 20}
+
+def test_prompt_version_changes_key():
+    """Tests that bumping the prompt version invalidates cached entries."""
+    assert llm_cache.make_key("invoice text", "v1", "gpt-4o") != llm_cache.make_key("invoice text", "v2", "gpt-4o")
+
+def test_model_changes_key():
+    """Tests that switching the model invalidates cached entries."""
+    assert llm_cache.make_key("invoice text", "v1", "gpt-4o") != llm_cache.make_key("invoice text", "v1", "gpt-4o-mini")
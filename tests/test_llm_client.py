@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+import pytest
+from extractor import llm_client
+
+class FakeClient:
+    """Mimics the parts of openai.OpenAI used by llm_client, returning canned JSON replies."""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+        self.response_formats = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    def create(self, **kwargs):
+        self.prompts.append(kwargs["messages"])
+        self.response_formats.append(kwargs["response_format"])
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        content = json.dumps(reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Installs a FakeClient factory and returns a setter for its replies."""
+    def install(*replies):
+        client = FakeClient(replies)
+        monkeypatch.setattr(llm_client, "_get_client", lambda api_key: client)
+        return client
+    return install
+
+def test_batch_uses_single_call(fake_client):
+    """Tests that a batch of invoices is answered by one request, in input order."""
+    client = fake_client({"invoices": [{"invoice_number": "PFS1"}, {"invoice_number": "PFS2"}]})
+    results = llm_client.extract_summary_data_batch(["text one", "text two"], "key")
+
+    assert [r["invoice_number"] for r in results] == ["PFS1", "PFS2"]
+    assert len(client.prompts) == 1
+    assert client.response_formats[0]["type"] == "json_schema"
+
+def test_batch_falls_back_on_mismatched_answer(fake_client):
+    """Tests that a batched answer with the wrong number of entries is retried per invoice."""
+    client = fake_client(
+        {"invoices": [{"invoice_number": "PFS1"}]},
+        {"invoice_number": "PFS1"},
+        {"invoice_number": "PFS2"},
+    )
+    results = llm_client.extract_summary_data_batch(["text one", "text two"], "key")
+
+    assert [r["invoice_number"] for r in results] == ["PFS1", "PFS2"]
+    assert len(client.prompts) == 3
+
+def test_bulk_maps_batch_api_results_and_retries_failures(fake_client):
+    """Tests that Batch API results are matched by custom_id and failed entries are retried directly."""
+    client = fake_client({"invoice_number": "PFS2"})
+    output = "\n".join([
+        json.dumps({"custom_id": "1", "response": {"status_code": 500, "body": {}}}),
+        json.dumps({"custom_id": "0", "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": json.dumps({"invoice_number": "PFS1"})}}]}}}),
+    ])
+    uploads = []
+    client.files = SimpleNamespace(
+        create=lambda file, purpose: uploads.append(file) or SimpleNamespace(id="file-in"),
+        content=lambda file_id: SimpleNamespace(text=output),
+    )
+    client.batches = SimpleNamespace(
+        create=lambda **kwargs: SimpleNamespace(id="batch-1", status="completed", output_file_id="file-out"),
+    )
+    results = llm_client.extract_summary_data_bulk(["text one", "text two"], "key")
+
+    assert [r["invoice_number"] for r in results] == ["PFS1", "PFS2"]
+    assert len(uploads[0][1].splitlines()) == 2
+    assert len(client.prompts) == 1
+
+def test_transient_errors_are_retried(fake_client, monkeypatch):
+    """Tests that a transient API error is retried instead of failing the invoice."""
+    monkeypatch.setattr(llm_client, "_RETRYABLE_ERRORS", (ConnectionError,))
+    monkeypatch.setattr(llm_client.time, "sleep", lambda seconds: None)
+    client = fake_client(ConnectionError("reset"), {"invoice_number": "PFS1"})
+
+    assert llm_client.extract_summary_data("text", "key") == {"invoice_number": "PFS1"}
+    assert len(client.prompts) == 2
+
+def test_other_errors_are_not_retried(fake_client):
+    """Tests that non-transient errors surface after a single attempt."""
+    client = fake_client(ValueError("bad request"), {"invoice_number": "PFS1"})
+
+    with pytest.raises(RuntimeError, match="bad request"):
+        llm_client.extract_summary_data("text", "key")
+    assert len(client.prompts) == 1
@@ -0,0 +1,40 @@
+from PIL import Image, ImageDraw
+from extractor import ocr
+from extractor.ocr import _binarize
+
+def test_binarize_separates_ink_from_paper():
+    """Tests that a grey scan is reduced to pure black text on white paper."""
+    img = Image.new("RGB", (100, 40), (200, 200, 190))
+    ImageDraw.Draw(img).rectangle((10, 10, 60, 20), fill=(60, 60, 70))
+    binary = _binarize(img)
+
+    assert binary.mode == "1"
+    assert binary.getpixel((0, 0)) == 255
+    assert binary.getpixel((30, 15)) == 0
+
+def test_binarize_blank_page():
+    """Tests that a blank page stays blank."""
+    assert _binarize(Image.new("RGB", (20, 20), "white")).getextrema() == (255, 255)
+
+def test_ocr_page_drops_low_confidence_words(monkeypatch):
+    """Tests that uncertain words are dropped and the rest are rejoined line by line."""
+    data = {
+        "text": ["", "Fatura", "No:", "~", "PFS2025000001235", "KDV", "%20"],
+        "conf": [-1, 96, 91, 12, 88, 95, 90],
+        "block_num": [1, 1, 1, 1, 1, 1, 1],
+        "par_num": [1, 1, 1, 1, 1, 1, 1],
+        "line_num": [0, 1, 1, 1, 1, 2, 2],
+    }
+    monkeypatch.setattr(ocr.pytesseract, "image_to_data", lambda img, lang, output_type: data)
+    monkeypatch.setattr(ocr, "_ocr_languages", lambda: ocr.OCR_LANGUAGES)
+
+    assert ocr._ocr_page(Image.new("RGB", (20, 20), "white")) == "Fatura No: PFS2025000001235\nKDV %20"
+
+def test_ocr_languages_fall_back_to_english(monkeypatch):
+    """Tests that OCR still runs in English when the Turkish language data is missing."""
+    monkeypatch.setattr(ocr.pytesseract, "get_languages", lambda config: ["eng", "osd"])
+    ocr._ocr_languages.cache_clear()
+    try:
+        assert ocr._ocr_languages() == "eng"
+    finally:
+        ocr._ocr_languages.cache_clear()
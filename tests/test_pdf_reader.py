@@ -0,0 +1,38 @@
+import io
+from PIL import Image
+from extractor.pdf_reader import has_text_layer, is_usable_text, read_pdf
+
+# A minimal one-page PDF with a Helvetica text object.
+TEXT_PDF = (
+    b"%PDF-1.4\n"
+    b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+    b"2 0 obj\n<< /Type /Pages /Kids [4 0 R] /Count 1 >>\nendobj\n"
+    b"3 0 obj\n<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\nendobj\n"
+    b"4 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 5 0 R"
+    b" /Resources << /Font << /F1 3 0 R >> >> >>\nendobj\n"
+    b"5 0 obj\n<< /Length 44 >>\nstream\nBT /F1 12 Tf 50 750 Td (Fatura LINE 1) Tj ET\nendstream\nendobj\n"
+    b"trailer << /Root 1 0 R >>\n%%EOF"
+)
+
+def _scanned_pdf() -> bytes:
+    """Renders a blank image-only PDF, like a scanner would produce."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (200, 200), "white").save(buffer, format="PDF")
+    return buffer.getvalue()
+
+def test_has_text_layer():
+    """Tests the byte-level scan/text-layer heuristic."""
+    assert has_text_layer(TEXT_PDF)
+    assert not has_text_layer(_scanned_pdf())
+
+def test_read_pdf_from_stream():
+    """Tests that read_pdf accepts an in-memory PDF."""
+    assert "Fatura LINE 1" in read_pdf(io.BytesIO(TEXT_PDF))
+
+def test_is_usable_text():
+    """Tests that short or garbled text layers are sent to OCR."""
+    invoice_text = "Fatura No: PFS2025000001235 Fatura Tarihi: 01.06.2025 HESAPLANAN KDV(%20) 7.377,00 TL\n" * 3
+    assert is_usable_text(invoice_text)
+    assert not is_usable_text("Sayfa 1/1")
+    assert not is_usable_text("(cid:12)(cid:34)(cid:56) " * 20 + invoice_text[:50])
+    assert not is_usable_text("\ufffd\ufffd\ufffd " * 40 + invoice_text[:50])
@@ -0,0 +1,29 @@
+from extractor.summary_regex import extract_summary_data_regex
+
+INVOICE_TEXT = """PARTNER FILO SIRKETI e-FATURA
+Fatura No: PFS2025000001235
+Fatura Tarihi: 01.06.2025 Son Odeme Tarihi: 15.06.2025
+MAL HIZMET TOPLAM TUTARI 36.885,00 TL
+HESAPLANAN KDV(%20) 7.377,00 TL
+"""
+
+def test_reads_all_fields():
+    """Tests that a well-formed invoice is summarized without the LLM."""
+    assert extract_summary_data_regex(INVOICE_TEXT) == {
+        "invoice_number": "PFS2025000001235", "invoice_date": "2025-06-01", "vat_percentage": 20,
+    }
+
+def test_ignores_payment_due_date():
+    """Tests that the payment due date is not taken for the invoice date."""
+    text = INVOICE_TEXT.replace("Fatura Tarihi: 01.06.2025 ", "")
+    assert extract_summary_data_regex(text) is None
+
+def test_ambiguous_vat_rate_needs_llm():
+    """Tests that several different VAT rates leave the invoice to the LLM."""
+    assert extract_summary_data_regex(INVOICE_TEXT + "HESAPLANAN KDV(%1) 10,00 TL\n") is None
+
+def test_other_dated_lines_need_llm():
+    """Tests that due, order and wrapped payment dates before the invoice date leave it to the LLM."""
+    for line in ("Vade Tarihi: 30.06.2025\n", "Siparis Tarihi: 15.05.2025\n", "Son Odeme\nTarihi: 30.06.2025\n"):
+        text = INVOICE_TEXT.replace("Fatura Tarihi:", line + "Fatura Tarihi:")
+        assert extract_summary_data_regex(text) is None, line
@@ -0,0 +1,126 @@
+import io
+import re
+import zipfile
+import pandas as pd
+import pytest
+from extractor.parser import process_transactions
+
+CSV_CONTENT = """Partner Filo Transaction Export,,,
+,,,
+PLATE,BRAND AND MODEL,TOTAL RENT,NOTES
+34-KVN-771,MERCEDES-BENZ A 200 SEDAN,36885.00,x
+34-ABC-123,RENAULT CLIO,0,zero amount
+34-DEF-456,FIAT EGEA,1000,
+,,,
+TOTAL,,37885.00,
+"""
+
+@pytest.fixture
+def transaction_file():
+    """Provides an in-memory CSV transaction file with a title row, a zero-amount row and a footer."""
+    file = io.BytesIO(CSV_CONTENT.encode("utf-8"))
+    file.name = "Invoice Details (153351).csv"
+    return file
+
+@pytest.fixture
+def summary_data():
+    """Provides a sample LLM summary response."""
+    return {"invoice_number": "PFS2025000001235", "invoice_date": "2025-06-01", "vat_percentage": 20}
+
+def test_process_transactions_leasing(transaction_file, summary_data):
+    """Tests header detection, row cleaning and enrichment for a leasing invoice."""
+    df = process_transactions(transaction_file, summary_data, "... LINE 1 ...")
+
+    assert list(df.columns) == [
+        'PLAKA', 'RENTAL VEHICLE BRAND AND MODEL', 'toplam ft.tutari',
+        'GROSS', 'DATE', 'DESCTRIPTION', 'INVOICE'
+    ]
+    assert list(df['PLAKA']) == ['34-KVN-771', '34-DEF-456', 'TOTAL']
+    assert list(df['toplam ft.tutari']) == pytest.approx([36885.00, 1000.0, 37885.00])
+    assert list(df['GROSS']) == pytest.approx([44262.00, 1200.0, 45462.00])
+    assert set(df['DATE']) == {'01.06.2025'}
+    assert set(df['DESCTRIPTION']) == {'leasing'}
+    assert set(df['INVOICE']) == {'PFS2025000001235'}
+
+def test_process_transactions_defaults(transaction_file):
+    """Tests the GEN.EXP description and the 20% VAT fallback when the summary is incomplete."""
+    df = process_transactions(transaction_file, {"invoice_number": "PFS1"}, "no marker")
+
+    assert set(df['DESCTRIPTION']) == {'GEN.EXP'}
+    assert df['GROSS'].iloc[0] == pytest.approx(36885.00 * 1.2)
+    assert df['DATE'].isna().all()
+
+def test_process_transactions_turkish_amounts(summary_data):
+    """Tests that amounts exported as Turkish-formatted text are parsed, not dropped as zero."""
+    file = io.BytesIO('PLAKA,MARKA MODEL,TOTAL RENT\n34-KVN-771,FIAT EGEA,"3.450.961,18"\n34-DEF-456,RENAULT CLIO,"1000,5"\n'.encode("utf-8"))
+    file.name = "Invoice Details (153352).csv"
+    df = process_transactions(file, summary_data, "")
+
+    assert list(df['toplam ft.tutari']) == pytest.approx([3450961.18, 1000.5])
+
+def test_process_transactions_english_amounts(summary_data):
+    """Tests that English-formatted text amounts, with or without decimals, are not read as Turkish."""
+    file = io.BytesIO(('PLAKA,MARKA MODEL,TOTAL RENT\n34-KVN-771,FIAT EGEA,"1,234.56"\n'
+                       '34-DEF-456,RENAULT CLIO,"2,500"\n34-ABC-123,FIAT DOBLO,"1,000"\n').encode("utf-8"))
+    file.name = "Invoice Details (153353).csv"
+    df = process_transactions(file, summary_data, "")
+
+    assert list(df['toplam ft.tutari']) == pytest.approx([1234.56, 2500.0, 1000.0])
+    assert list(df['GROSS']) == pytest.approx([1234.56 * 1.2, 3000.0, 1200.0])
+
+def test_process_transactions_missing_columns(summary_data):
+    """Tests that a clear error is raised when required columns are absent."""
+    file = io.BytesIO(b"PLATE,SOMETHING\n34-KVN-771,1\n")
+    file.name = "broken.csv"
+    with pytest.raises(ValueError, match="Brand, Amount"):
+        process_transactions(file, summary_data, "")
+
+def test_process_transactions_excel(summary_data):
+    """Tests that Excel transaction files go through the same header detection and cleaning."""
+    rows = [["Partner Filo Transaction Export", None, None], [None, None, None],
+            ["PLAKA", "MODEL", "TOTAL AMOUNT"], ["34-KVN-771", "MERCEDES-BENZ A 200 SEDAN", 36885.0]]
+    file = io.BytesIO()
+    pd.DataFrame(rows).to_excel(file, header=False, index=False)
+    file.seek(0)
+    file.name = "Invoice Details (153351).xlsx"
+
+    df = process_transactions(file, summary_data, "")
+    assert list(df['PLAKA']) == ['34-KVN-771']
+    assert df['GROSS'].iloc[0] == pytest.approx(44262.00)
+
+def test_process_transactions_day_first_date(transaction_file, summary_data):
+    """Tests that a Turkish DD.MM.YYYY date from the LLM is not read month-first."""
+    df = process_transactions(transaction_file, {**summary_data, "invoice_date": "01.06.2025"}, "")
+
+    assert set(df['DATE']) == {'01.06.2025'}
+
+def test_process_transactions_excel_with_two_plate_columns(summary_data):
+    """Tests that only the first matching column is used when a sheet has both PLATE and PLAKA."""
+    rows = [["PLATE", "PLAKA", "MODEL", "TOTAL AMOUNT"], ["34-KVN-771", "34 KVN 771", "FIAT EGEA", 1000.0]]
+    file = io.BytesIO()
+    pd.DataFrame(rows).to_excel(file, header=False, index=False)
+    file.seek(0)
+    file.name = "Invoice Details (153354).xlsx"
+
+    df = process_transactions(file, summary_data, "")
+    assert list(df['PLAKA']) == ['34-KVN-771']
+    assert df['GROSS'].iloc[0] == pytest.approx(1200.0)
+
+def test_process_transactions_excel_with_stale_dimension(summary_data):
+    """Tests that an .xlsx whose stored sheet dimension is a stale "A1" is still read in full."""
+    rows = [["Partner Filo Transaction Export", None, None],
+            ["PLAKA", "MODEL", "TOTAL AMOUNT"], ["34-KVN-771", "FIAT EGEA", 1000.0]]
+    source = io.BytesIO()
+    pd.DataFrame(rows).to_excel(source, header=False, index=False)
+    file = io.BytesIO()
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(file, "w") as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = re.sub(rb'<dimension ref="[^"]*"/>', b'<dimension ref="A1"/>', data)
+            dst.writestr(item, data)
+    file.seek(0)
+    file.name = "Invoice Details (153355).xlsx"
+
+    df = process_transactions(file, summary_data, "")
+    assert list(df['PLAKA']) == ['34-KVN-771']